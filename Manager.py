@@ -26,7 +26,9 @@ class Manager:
                  processes: list[Process],
                  end_timestamp: float,
                  weights: dict[str, float] | None = None,
-                 random_wait_uuid: str = None
+                 random_wait_uuid: str = None,
+                 random_seed: int | None = None,
+                 mutate: bool = True
                  ):
         self.id = manager_id
         self.gen_id = gen_id
@@ -38,8 +40,8 @@ class Manager:
             else weights
         )
         self.trace = []
-        self.weights[self.random_wait_uuid] = random.random()
-        self.random_seed = random.randint(0, 100000)
+        self.weights.setdefault(self.random_wait_uuid, random.random())
+        self.random_seed = random_seed if random_seed is not None else random.randint(0, 100000)
         self.rng_seed = random.Random(self.random_seed)
         self.stock = stock.clone()
         self.end_timestamp = end_timestamp
@@ -47,7 +49,8 @@ class Manager:
         self.score = 0
         self.cycle = 0
         self.nb_completed_processes = 0
-        self.__mutate()
+        if mutate:
+            self.__mutate()
 
     def reset(self, stock: Stock, end_timestamp: float) -> None:
         """
@@ -18,6 +18,9 @@ def argparse_init():
     parser.add_argument('delay', type=int, help='Numeric delay to not exceed')
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--only-trace", action="store_true", help="Print only the trace of the simulation, without any additional information")
+    parser.add_argument("--best-out", metavar="PATH", help="Atomically write the best genome, score and trace to PATH whenever a generation improves on it")
+    parser.add_argument("--local-search", action="store_true", help="Refine the best individuals with a local search between generations")
+    parser.add_argument("--cache-dir", metavar="DIR", help="Directory in which parsed input files are cached, keyed by their content")
     return parser
 
 def argparse_verif_init():
@@ -27,4 +30,21 @@ def argparse_verif_init():
     )
     parser.add_argument('input_file', type=existing_file, help='path to the input file')
     parser.add_argument('trace_file', type=existing_file, help='path to the trace file')
+    parser.add_argument("--cache-dir", metavar="DIR", help="directory in which parsed input files are cached, keyed by their content")
+    parser.add_argument("--follow", action="store_true", help="keep verifying lines appended to the trace file until interrupted")
+    parser.add_argument("--checkpoint", metavar="PATH", help="resume verification from PATH if it exists, and save the verification state to it")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between two checks for appended lines in follow mode (default: 1.0)")
+    return parser
+
+def argparse_daemon_init():
+    parser = argparse.ArgumentParser(
+        description='Run krpsim as a daemon that keeps a warm worker pool and serves optimization jobs',
+        usage="python3.10 krpsim_daemon.py [--socket <path> | --host <host> --port <port>]"
+    )
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket at PATH instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--local-search", action="store_true", help="Refine the best individuals with a local search between generations")
+    parser.add_argument("--max-jobs", type=int, default=None, help="Maximum amount of jobs run concurrently (default: cpu count)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug mode")
     return parser
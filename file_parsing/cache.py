@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+
+from kr_config import PARSE_CACHE_FORMAT_VERSION, PARSE_CACHE_MAX_SIZE
+from file_parsing.parser import display_parsed_data, parse_content
+from process import Process
+from stock import Stock
+from utils.atomic_write import atomic_write
+
+
+CACHE_FILE_SUFFIX = ".krcache"
+
+logger = logging.getLogger()
+
+def parse_cached(input_file: str, cache_dir: str, max_size: int = PARSE_CACHE_MAX_SIZE) -> tuple[Stock, list[Process]]:
+    """
+    Parses the input file, reusing a previously parsed model stored in cache_dir when the file's content is unchanged.
+    Entries are keyed by the content hash and the cache format version. The cache directory is kept under max_size bytes.
+    :return: tuple[Stock, list[Process]]
+    """
+    with open(input_file, 'rb') as file:
+        data = file.read()
+
+    cache_path = get_cache_path(cache_dir, data)
+
+    cached_model = load_cache_entry(cache_path)
+    if cached_model is not None:
+        logger.debug(f"Parsed model loaded from cache: {cache_path}")
+        stock, processes = cached_model
+    else:
+        stock, processes = parse_content(data.decode())
+        store_cache_entry(cache_dir, cache_path, (stock, processes), max_size)
+
+    display_parsed_data(stock, processes)
+    return stock, processes
+
+
+def get_cache_path(cache_dir: str, data: bytes) -> str:
+    content_hash = hashlib.sha256(data).hexdigest()
+    return os.path.join(cache_dir, f"{content_hash}.v{PARSE_CACHE_FORMAT_VERSION}{CACHE_FILE_SUFFIX}")
+
+
+def load_cache_entry(cache_path: str) -> tuple[Stock, list[Process]] | None:
+    """
+    Loads a cache entry and marks it as recently used. Missing or unreadable entries are treated as a cache miss.
+    :return: tuple[Stock, list[Process]] | None
+    """
+    try:
+        with open(cache_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            cached_model = pickle.loads(mapped)
+        os.utime(cache_path)
+        return cached_model
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable cache entry {cache_path}: {e}")
+        return None
+
+
+def store_cache_entry(cache_dir: str, cache_path: str, model: tuple[Stock, list[Process]], max_size: int) -> None:
+    """
+    Stores a parsed model in the cache, then evicts entries beyond max_size.
+    The cache is only an optimization: failing to write it is logged and otherwise ignored.
+    :return: None
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        atomic_write(cache_path, pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as e:
+        logger.debug(f"Could not write cache entry {cache_path}: {e}")
+        return
+    evict_cache_entries(cache_dir, max_size)
+
+
+def evict_cache_entries(cache_dir: str, max_size: int) -> None:
+    """
+    Removes the least recently used entries until the cache directory fits in max_size bytes.
+    Entries that cannot be inspected or removed are skipped.
+    :return: None
+    """
+    entries = []
+    try:
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+    except OSError as e:
+        logger.debug(f"Could not list cache directory {cache_dir}: {e}")
+        return
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Could not evict cache entry {path}: {e}")
+            continue
+        total_size -= size
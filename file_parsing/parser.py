@@ -19,13 +19,25 @@ OPTIMIZE_PATTERN_EXPR = "^(optimize):\(((?:\w+|time)(?:;(?:\w+|time))*)\)$"
 logger = logging.getLogger()
 
 def parse(input_file: str) -> tuple[Stock, list[Process]]:
+    with open(input_file, 'r') as file:
+        data = file.read()
+
+    stock, processes = parse_content(data)
+    display_parsed_data(stock, processes)
+    return stock, processes
+
+
+def display_parsed_data(stock: Stock, processes: list[Process]) -> None:
+    if not kr_config.PRINT_ONLY_TRACE:
+        display_config_file_data(len(processes), len(stock.inventory), len(stock.resources_to_optimize))
+
+
+def parse_content(data: str) -> tuple[Stock, list[Process]]:
     stock: Stock = Stock()
     processes: list[Process] = []
     to_optimize: set[str] = set()
 
-    with open(input_file, 'r') as file:
-        data = file.read()
-        file_lines = data.splitlines()
+    file_lines = data.splitlines()
 
     # Collects all line from the file that are not empty and not comments
     file_lines = [line for line in file_lines if line.strip() and not line.strip().startswith('#')]
@@ -68,9 +80,6 @@ def parse(input_file: str) -> tuple[Stock, list[Process]]:
     if not to_optimize:
         raise FileFormatOrderError()
 
-    if not kr_config.PRINT_ONLY_TRACE:
-        display_config_file_data(len(processes), len(stock.inventory), len(stock.resources_to_optimize))
-
     return stock, processes
 
 
@@ -1,6 +1,21 @@
 DEBUG = False
 PRINT_ONLY_TRACE = False
+BEST_OUT_PATH = None
+LOCAL_SEARCH = False
 POPULATION_SIZE = 100
 MAX_CYCLE_PER_MANAGER = 2000
 MUTATION_RATE = 0.1
-OPTIMIZE_RESOURCE_SCORE = 1000000
\ No newline at end of file
+OPTIMIZE_RESOURCE_SCORE = 1000000
+HEURISTIC_SEED_RATIO = 0.3
+DEMAND_DECAY = 0.8
+MIN_DEMAND = 0.01
+LOCAL_SEARCH_ELITES = 3
+LOCAL_SEARCH_NEIGHBOURS = 4
+LOCAL_SEARCH_STEP = 0.1
+LOCAL_SEARCH_TIME_RATIO = 0.2
+PARSE_CACHE_FORMAT_VERSION = 1
+PARSE_CACHE_MAX_SIZE = 64 * 1024 * 1024
+TRACE_CHUNK_SIZE = 4 * 1024 * 1024
+CHECKPOINT_HASH_WINDOW = 4096
+UPPER_BOUND_TIME_RATIO = 0.05
+UPPER_BOUND_MAX_PIVOTS = 10000
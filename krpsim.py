@@ -8,6 +8,7 @@ import simulation
 import sys
 
 from arg_parse.argparse_init import argparse_init
+from file_parsing.cache import parse_cached
 from file_parsing.parser import parse
 
 def logging_init(debug: bool):
@@ -30,12 +31,14 @@ def main() -> int:
 
     # Handle debug mode so that the whole program has access to it
     kr_config.DEBUG = args.debug
+    kr_config.LOCAL_SEARCH = args.local_search
     kr_config.PRINT_ONLY_TRACE = args.only_trace
+    kr_config.BEST_OUT_PATH = args.best_out
 
     delay = int(args.delay)
     if delay <= 0:
         raise ValueError("Delay must be greater than 0")
-    stock, processes = parse(args.input_file)
+    stock, processes = parse_cached(args.input_file, args.cache_dir) if args.cache_dir else parse(args.input_file)
     end_timestamp = start_of_program + delay
     simulation.start(stock, processes, end_timestamp)
 
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+import traceback
+from multiprocessing.pool import Pool
+from os import cpu_count
+from threading import Event
+
+import kr_config
+import simulation
+from arg_parse.argparse_init import argparse_daemon_init
+from file_parsing.parser import parse_content
+from krpsim import logging_init
+from krpsim_verif import KrpSimVerifier, get_process_ids
+from Manager import Manager
+from upper_bound import compute_upper_bound, get_optimized_quantity
+
+
+# Jobs and configs can be large, the default 64 KiB line limit of asyncio streams is not enough
+STREAM_LIMIT = 16 * 1024 * 1024
+
+logger = logging.getLogger()
+
+class KrpSimDaemon:
+    """
+    Serves optimization jobs over a local socket, sharing one warm worker pool between all of them.
+    A job is a single JSON line: {"config": <config file content>, "delay": <seconds>, "verify": <bool, optional>}.
+    The daemon answers with JSON lines: one "progress" event per generation, then a "result" or an "error" event.
+    A job stops early when its best manager reaches the upper bound of the config, if one can be computed and time is not optimized.
+    The result's optimality gap only covers the resources to optimize other than time.
+    Every job submits its generations to the same pool, whose queue interleaves them, so concurrent jobs share the CPU.
+    :param pool: Worker pool the managers are run on.
+    :param max_jobs: Maximum amount of jobs run concurrently, the others wait for a free slot.
+    """
+    def __init__(self, pool: Pool, max_jobs: int):
+        self.pool = pool
+        self.job_slots = asyncio.Semaphore(max_jobs)
+        self.job_count = 0
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Reads one job from the client, runs it and streams its events back.
+        :return: None
+        """
+        self.job_count += 1
+        job_id = self.job_count
+        # Stops the job's evolution when the client goes away, so that it does not keep using the pool
+        cancelled = Event()
+        try:
+            try:
+                request_line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError) as err:
+                writer.write(json.dumps({"event": "error", "message": f"Invalid job: {err}"}).encode() + b"\n")
+                await writer.drain()
+                return
+            job_events = self.run_job(job_id, request_line, cancelled)
+            try:
+                async for event in job_events:
+                    writer.write(json.dumps(event).encode() + b"\n")
+                    await writer.drain()
+            finally:
+                cancelled.set()
+                await job_events.aclose()
+        except ConnectionError:
+            logger.info(f"Job {job_id} - Client disconnected")
+        finally:
+            writer.close()
+
+    async def run_job(self, job_id: int, request_line: bytes, cancelled: Event):
+        """
+        Runs a job and yields its events as they happen. Setting cancelled stops the job's evolution.
+        :return: AsyncIterator[dict]
+        """
+        try:
+            request = json.loads(request_line)
+            config = request["config"]
+            delay = float(request["delay"])
+            verify = bool(request.get("verify", False))
+            if delay <= 0:
+                raise ValueError("Delay must be greater than 0")
+            stock, processes = parse_content(config)
+        except Exception as err:
+            yield {"event": "error", "message": f"Invalid job: {err}"}
+            return
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue[dict] = asyncio.Queue()
+
+        def on_generation(generation_index: int, best_manager: Manager) -> None:
+            progress = {"event": "progress", "generation": generation_index, "score": best_manager.score}
+            loop.call_soon_threadsafe(events.put_nowait, progress)
+
+        async with self.job_slots:
+            logger.info(f"Job {job_id} - Started with a delay of {delay}s")
+            # The time budget starts once the job gets a slot, not while it waits for one
+            end_timestamp = time.monotonic() + delay
+            upper_bound = await asyncio.to_thread(compute_upper_bound, stock, processes, end_timestamp)
+            evolution = asyncio.create_task(asyncio.to_thread(
+                simulation.evolve, stock, processes, end_timestamp, self.pool, on_generation, None, upper_bound, cancelled
+            ))
+            while not evolution.done() or not events.empty():
+                next_event = asyncio.create_task(events.get())
+                await asyncio.wait({evolution, next_event}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield next_event.result()
+                else:
+                    next_event.cancel()
+
+        try:
+            the_moat, generation_index = evolution.result()
+        except Exception as err:
+            if kr_config.DEBUG:
+                traceback.print_exc()
+            yield {"event": "error", "message": str(err)}
+            return
+
+        result = {
+            "event": "result",
+            "generations": generation_index,
+            "score": the_moat.score,
+            "cycles": the_moat.cycle,
+            "final_stock": the_moat.stock.inventory,
+            "trace": [f"{cycle}:{process_name}" for cycle, process_name in the_moat.trace],
+            "upper_bound": upper_bound,
+            "optimality_gap": None if upper_bound is None else upper_bound - get_optimized_quantity(the_moat.stock),
+        }
+        if verify:
+            process_ids = get_process_ids(processes)
+            verifier = KrpSimVerifier(stock.clone(), processes)
+            result["verified"] = await asyncio.to_thread(
+                verifier.run,
+                [cycle for cycle, _ in the_moat.trace],
+                [process_ids[process_name] for _, process_name in the_moat.trace]
+            )
+        logger.info(f"Job {job_id} - Finished after {generation_index} generations with a score of {the_moat.score}")
+        yield result
+
+
+async def serve(daemon: KrpSimDaemon, socket_path: str | None, host: str, port: int) -> None:
+    """
+    Listens on the Unix socket if one is given, on host:port otherwise, until the process is interrupted.
+    :return: None
+    """
+    if socket_path is not None:
+        server = await asyncio.start_unix_server(daemon.handle_client, path=socket_path, limit=STREAM_LIMIT)
+    else:
+        server = await asyncio.start_server(daemon.handle_client, host=host, port=port, limit=STREAM_LIMIT)
+
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    logger.info(f"Listening on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> int:
+    parser = argparse_daemon_init()
+    args = parser.parse_args()
+
+    logging_init(args.debug)
+    kr_config.DEBUG = args.debug
+    kr_config.LOCAL_SEARCH = args.local_search
+    kr_config.PRINT_ONLY_TRACE = True
+
+    max_jobs = args.max_jobs if args.max_jobs is not None else cpu_count()
+    if max_jobs <= 0:
+        raise ValueError("Maximum amount of jobs must be greater than 0")
+
+    # The pool is created before any thread is started so that workers are forked from a clean process
+    with Pool(processes=cpu_count()) as pool:
+        daemon = KrpSimDaemon(pool, max_jobs)
+        try:
+            asyncio.run(serve(daemon, args.socket, args.host, args.port))
+        except KeyboardInterrupt:
+            logger.info("Shutting down")
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except Exception as err:
+        if kr_config.DEBUG:
+            traceback.print_exc()
+        print(err)
+        sys.exit(1)
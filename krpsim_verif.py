@@ -1,6 +1,16 @@
+import hashlib
+import json
+import mmap
+import os
+import time
 import traceback
 import sys
 import re
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from os import cpu_count
 
 import kr_config
 from arg_parse.argparse_init import argparse_verif_init
@@ -8,55 +18,195 @@ from custom_exceptions.NotEnoughResourcesError import NotEnoughResourcesError
 from custom_exceptions.ProcessNameNotFoundError import ProcessNameNotFoundError
 from custom_exceptions.ImpossibleCycleOrderError import ImpossibleCycleOrderError
 from custom_exceptions.InvalidTraceLineError import InvalidTraceLineError
+from file_parsing.cache import parse_cached
 from file_parsing.parser import parse, NUMERIC_EXPR, ALLOWED_CHAR_EXPR
 from process import Process
 from stock import Stock
+from utils.atomic_write import atomic_write
+from utils.pluralize import pluralize
 
 TRACE_LINE_FORMAT = f"^({NUMERIC_EXPR}):({ALLOWED_CHAR_EXPR})$"
+TRACE_LINE_PATTERN = re.compile(TRACE_LINE_FORMAT)
 
-def parse_trace_line(trace_line: str, processes: list[Process]) -> tuple[int, str]:
+@dataclass
+class TraceChunk:
+    """
+    Result of parsing a chunk of the trace file.
+    :param cycles: Cycle of each parsed line.
+    :param process_ids: Index in the process list of each parsed line's process.
+    :param failed_line: Line on which parsing stopped, None if the whole chunk was parsed.
+    """
+    cycles: array = field(default_factory=lambda: array('q'))
+    process_ids: array = field(default_factory=lambda: array('I'))
+    failed_line: str | None = None
+
+
+def get_process_ids(processes: list[Process]) -> dict[str, int]:
+    """
+    Maps each process name to its index in the process list.
+    :param processes: List of available processes.
+    :return: Dictionary of process_name: process_id.
+    """
+    return {process.name: process_id for process_id, process in enumerate(processes)}
+
+
+def parse_trace_line(trace_line: str, process_ids: dict[str, int]) -> tuple[int, int]:
     """
     Parse a single line from the trace file.
     :param trace_line: Line to parse.
-    :param processes: List of available processes.
-    :return: Tuple of (cycle, process_name).
+    :param process_ids: Ids of the available processes, by name.
+    :return: Tuple of (cycle, process_id).
     :raises InvalidTraceLineError: If the line format is invalid.
-    :raises ValueError: If the cycle is not a valid integer.
     :raises ProcessNameNotFoundError: If the process name is not found in the list
     """
-    match = re.search(TRACE_LINE_FORMAT, trace_line)
+    match = TRACE_LINE_PATTERN.match(trace_line)
     if not match:
         raise InvalidTraceLineError(trace_line)
-    cycle = match.group(1)
     process_name = match.group(2)
-    process_exists = any(p.name == process_name for p in processes)
-    if not process_exists:
+    if process_name not in process_ids:
         raise ProcessNameNotFoundError(process_name)
-    return int(cycle), process_name
+    return int(match.group(1)), process_ids[process_name]
 
 
-def parse_trace(trace_file: str, processes: list[Process]) -> list[tuple[int, str]] | None:
+def get_chunk_boundaries(mapped_trace: mmap.mmap, start: int, end: int, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    Splits a byte range of the trace into chunks of about chunk_size bytes, each ending at the end of a line.
+    :param mapped_trace: Memory-mapped trace file.
+    :param start: Offset of the range's first byte.
+    :param end: Offset right after the range's last byte.
+    :param chunk_size: Minimum size of a chunk, in bytes.
+    :return: List of (start, end) byte offsets.
+    """
+    boundaries = []
+    while start < end:
+        chunk_end = mapped_trace.find(b"\n", min(start + chunk_size, end) - 1, end)
+        chunk_end = end if chunk_end == -1 else chunk_end + 1
+        boundaries.append((start, chunk_end))
+        start = chunk_end
+    return boundaries
+
+
+def parse_trace_chunk(trace_file: str, start: int, end: int, process_ids: dict[str, int]) -> TraceChunk:
+    """
+    Parse the lines between two byte offsets of the trace file. Parsing stops at the first line that is invalid,
+    refers to an unknown process or goes back in time; that line is kept so that the caller can report it.
+    The order of the chunk's first line relative to the previous chunk is left to the caller.
+    :param trace_file: Path to the trace file.
+    :param start: Offset of the chunk's first byte.
+    :param end: Offset right after the chunk's last byte.
+    :param process_ids: Ids of the available processes, by name.
+    :return: TraceChunk
+    """
+    chunk = TraceChunk()
+    with open(trace_file, 'rb') as trace, mmap.mmap(trace.fileno(), 0, access=mmap.ACCESS_READ) as mapped_trace:
+        lines = mapped_trace[start:end].decode().splitlines()
+
+    last_cycle = 0
+    for line in lines:
+        try:
+            cycle, process_id = parse_trace_line(line.strip(), process_ids)
+        except (InvalidTraceLineError, ProcessNameNotFoundError):
+            chunk.failed_line = line
+            break
+        if cycle < last_cycle:
+            chunk.failed_line = line
+            break
+        chunk.cycles.append(cycle)
+        chunk.process_ids.append(process_id)
+        last_cycle = cycle
+    return chunk
+
+
+def parse_trace_range(trace_file: str, start: int, end: int, process_ids: dict[str, int],
+                      last_cycle: int = 0, line_offset: int = 0) -> tuple[array, array]:
+    """
+    Parse the lines between two byte offsets of the trace file. The range is split into chunks that are parsed
+    in parallel when it is larger than TRACE_CHUNK_SIZE.
+    :param trace_file: Path to the trace file.
+    :param start: Offset of the range's first byte, at the start of a line.
+    :param end: Offset right after the range's last byte, at the end of a line.
+    :param process_ids: Ids of the available processes, by name.
+    :param last_cycle: Cycle of the line preceding the range.
+    :param line_offset: Amount of lines preceding the range, to report line numbers.
+    :return: Tuple of (cycles, process_ids) arrays.
+    :raises InvalidTraceLineError: If a line format is invalid.
+    :raises ProcessNameNotFoundError: If a process name is not found in the list.
+    :raises ImpossibleCycleOrderError: If a line goes back in time.
+    """
+    if start >= end:
+        return array('q'), array('I')
+
+    with open(trace_file, 'rb') as trace, mmap.mmap(trace.fileno(), 0, access=mmap.ACCESS_READ) as mapped_trace:
+        boundaries = get_chunk_boundaries(mapped_trace, start, end, kr_config.TRACE_CHUNK_SIZE)
+
+    chunk_args = [(trace_file, chunk_start, chunk_end, process_ids) for chunk_start, chunk_end in boundaries]
+    if len(chunk_args) <= 1:
+        chunks = [parse_trace_chunk(*args) for args in chunk_args]
+    else:
+        with Pool(processes=min(cpu_count(), len(chunk_args))) as pool:
+            chunks = pool.starmap(parse_trace_chunk, chunk_args)
+
+    cycles, parsed_process_ids = array('q'), array('I')
+    for chunk in chunks:
+        previous_cycle = cycles[-1] if cycles else last_cycle
+        if chunk.cycles and chunk.cycles[0] < previous_cycle:
+            raise ImpossibleCycleOrderError(chunk.cycles[0], previous_cycle, line_offset + len(cycles) + 1)
+        cycles.extend(chunk.cycles)
+        parsed_process_ids.extend(chunk.process_ids)
+        if chunk.failed_line is not None:
+            # Parsing the line again raises its format or process name error, otherwise it went back in time
+            cycle, _ = parse_trace_line(chunk.failed_line.strip(), process_ids)
+            raise ImpossibleCycleOrderError(cycle, cycles[-1] if cycles else last_cycle, line_offset + len(cycles) + 1)
+    return cycles, parsed_process_ids
+
+
+def parse_trace(trace_file: str, processes: list[Process]) -> tuple[array, array] | None:
     """
     Parse the entire trace file.
     :param trace_file: Path to the trace file.
     :param processes: List of available processes.
-    :return: List of tuples containing (cycle, process_name) or None if an error occurs.
+    :return: Tuple of (cycles, process_ids) arrays or None if an error occurs.
     """
     try:
-        parsed_lines: list[tuple[int, str]] = []
-        with open(trace_file, 'r') as trace:
-            last_cycle = 0
-            for index, line in enumerate(trace):
-                cycle, process_name = parse_trace_line(line.strip(), processes)
-                if cycle < last_cycle:
-                    raise ImpossibleCycleOrderError(cycle, last_cycle, index + 1)
-                parsed_lines.append((cycle, process_name))
-                last_cycle = cycle
-        return parsed_lines
+        return parse_trace_range(trace_file, 0, os.path.getsize(trace_file), get_process_ids(processes))
     except Exception as e:
         print(e)
         return None
 
+def hash_model(stock: Stock, processes: list[Process]) -> str:
+    """
+    Hash the initial stock, resources to optimize and processes, to recognize the input file a checkpoint belongs to.
+    :param stock: Initial stock of resources.
+    :param processes: List of available processes.
+    :return: Hexadecimal digest.
+    """
+    model = (
+        sorted(stock.inventory.items()),
+        sorted(stock.resources_to_optimize),
+        [(p.name, sorted((p.inputs or {}).items()), sorted((p.outputs or {}).items()), p.delay) for p in processes],
+    )
+    return hashlib.sha256(json.dumps(model).encode()).hexdigest()
+
+
+def hash_trace_prefix(trace_file: str | None, end: int) -> str:
+    """
+    Hash the first and last CHECKPOINT_HASH_WINDOW bytes of the first end bytes of the trace file, to detect that
+    the part of the trace a checkpoint already verified was rotated or rewritten. Its cost does not grow with the trace.
+    :param trace_file: Path to the trace file, None when nothing was verified yet.
+    :param end: Offset right after the last verified byte.
+    :return: Hexadecimal digest.
+    """
+    prefix_hash = hashlib.sha256(str(end).encode())
+    if trace_file is not None and end > 0:
+        window = kr_config.CHECKPOINT_HASH_WINDOW
+        with open(trace_file, 'rb') as trace:
+            prefix_hash.update(trace.read(min(window, end)))
+            tail_start = max(min(window, end), end - window)
+            trace.seek(tail_start)
+            prefix_hash.update(trace.read(end - tail_start))
+    return prefix_hash.hexdigest()
+
+
 class KrpSimVerifier:
     """
     Class to verify the simulation based on the provided stock and processes.
@@ -66,8 +216,14 @@ class KrpSimVerifier:
     def __init__(self, stock: Stock, processes: list[Process]):
         self.stock = stock
         self.processes = processes
+        self.process_ids = get_process_ids(processes)
+        self.model_hash = hash_model(stock, processes)
         self.current_cycle = 0
         self.running_processes: list[tuple[int, Process]] = []  # (end_cycle, Process)
+        # Position in the trace file up to which lines were verified, for incremental verification
+        self.trace_offset = 0
+        self.trace_prefix_hash = hash_trace_prefix(None, 0)
+        self.line_count = 0
 
     def __remove_from_stock(self, items: dict[str, int]):
         """
@@ -119,34 +275,124 @@ class KrpSimVerifier:
             self.__add_to_stock(proc.outputs)
             self.running_processes.remove((end_cycle, proc))
 
-    def run(self, parsed_lines: list[tuple[int, str]]) -> bool:
+    def feed(self, cycles: Sequence[int], process_ids: Sequence[int]) -> bool:
         """
-        Run the simulation verifier with the parsed trace lines.
-        :param parsed_lines: List of tuples containing (cycle, process_name).
-        :return: True if simulation completes successfully, False otherwise.
+        Replay trace lines, keeping processes that are still running for the next lines.
+        :param cycles: Cycle of each trace line.
+        :param process_ids: Index in the process list of each trace line's process.
+        :return: True if every line could be replayed, False otherwise.
         """
         try:
-            for cycle, process_name in parsed_lines:
+            for cycle, process_id in zip(cycles, process_ids):
                 self.current_cycle = cycle
                 self.__complete_processes(self.current_cycle)
-                process = next(p for p in self.processes if p.name == process_name)
+                process = self.processes[process_id]
                 if not self.__does_stock_have_inputs(process.inputs):
-                    raise NotEnoughResourcesError(process_name, self.stock.inventory, process.inputs)
+                    raise NotEnoughResourcesError(process.name, self.stock.inventory, process.inputs)
                 self.__remove_from_stock(process.inputs)
                 end_cycle = self.current_cycle + process.delay
                 self.running_processes.append((end_cycle, process))
-            if self.running_processes:
-                for end_cycle, proc in self.running_processes:
-                    if end_cycle >= kr_config.MAX_CYCLE_PER_MANAGER:
-                        break
-                    self.current_cycle = end_cycle
-                    self.__add_to_stock(proc.outputs)
-                self.running_processes.clear()
             return True
         except Exception as e:
             print(e)
             return False
 
+    def finish(self) -> None:
+        """
+        Complete the processes still running at the end of the trace.
+        :return: None
+        """
+        if self.running_processes:
+            for end_cycle, proc in self.running_processes:
+                if end_cycle >= kr_config.MAX_CYCLE_PER_MANAGER:
+                    break
+                self.current_cycle = end_cycle
+                self.__add_to_stock(proc.outputs)
+            self.running_processes.clear()
+
+    def run(self, cycles: Sequence[int], process_ids: Sequence[int]) -> bool:
+        """
+        Run the simulation verifier with the parsed trace lines.
+        :param cycles: Cycle of each trace line.
+        :param process_ids: Index in the process list of each trace line's process.
+        :return: True if simulation completes successfully, False otherwise.
+        """
+        if not self.feed(cycles, process_ids):
+            return False
+        self.finish()
+        return True
+
+    def verify_appended(self, trace_file: str, include_partial_line: bool = False) -> int | None:
+        """
+        Verify the complete lines appended to the trace file since the last call, or since the loaded checkpoint.
+        A trailing line that does not end with a newline yet is left for the next call, unless include_partial_line is set.
+        :param trace_file: Path to the trace file.
+        :param include_partial_line: Whether to also verify a trailing line without newline, once the trace is over.
+        :return: Amount of newly verified lines, None if verification failed.
+        """
+        try:
+            trace_size = os.path.getsize(trace_file)
+            if trace_size < self.trace_offset:
+                raise ValueError(f"Trace file '{trace_file}' is shorter than the {self.trace_offset} bytes already verified.")
+            with open(trace_file, 'rb') as trace:
+                trace.seek(self.trace_offset)
+                appended_data = trace.read(trace_size - self.trace_offset)
+            end = trace_size if include_partial_line else self.trace_offset + appended_data.rfind(b"\n") + 1
+            last_cycle = self.current_cycle if self.line_count else 0
+            cycles, process_ids = parse_trace_range(trace_file, self.trace_offset, end, self.process_ids,
+                                                    last_cycle, self.line_count)
+        except Exception as e:
+            print(e)
+            return None
+
+        if not self.feed(cycles, process_ids):
+            return None
+        self.trace_offset = end
+        self.trace_prefix_hash = hash_trace_prefix(trace_file, end)
+        self.line_count += len(cycles)
+        return len(cycles)
+
+    def save_checkpoint(self, checkpoint_file: str) -> None:
+        """
+        Save the verification state so that a later invocation resumes where this one stopped.
+        :param checkpoint_file: Path to the checkpoint file, replaced atomically.
+        :return: None
+        """
+        checkpoint = {
+            "model_hash": self.model_hash,
+            "trace_offset": self.trace_offset,
+            "trace_prefix_hash": self.trace_prefix_hash,
+            "line_count": self.line_count,
+            "current_cycle": self.current_cycle,
+            "inventory": self.stock.inventory,
+            "running_processes": [(end_cycle, self.process_ids[proc.name]) for end_cycle, proc in self.running_processes],
+        }
+        atomic_write(checkpoint_file, json.dumps(checkpoint).encode())
+
+    def load_checkpoint(self, checkpoint_file: str, trace_file: str) -> None:
+        """
+        Restore the verification state saved by save_checkpoint.
+        :param checkpoint_file: Path to the checkpoint file.
+        :param trace_file: Path to the trace file the checkpoint is resumed on.
+        :return: None
+        :raises ValueError: If the checkpoint was saved for another input file, or if the part of the trace
+        it already verified has changed since.
+        """
+        with open(checkpoint_file, 'r') as file:
+            checkpoint = json.load(file)
+        if checkpoint["model_hash"] != self.model_hash:
+            raise ValueError(f"Checkpoint '{checkpoint_file}' does not match the stock and processes of the input file.")
+        trace_offset = checkpoint["trace_offset"]
+        if (os.path.getsize(trace_file) < trace_offset
+                or hash_trace_prefix(trace_file, trace_offset) != checkpoint["trace_prefix_hash"]):
+            raise ValueError(f"Checkpoint '{checkpoint_file}' does not match the already verified part of '{trace_file}'.")
+        self.trace_offset = trace_offset
+        self.trace_prefix_hash = checkpoint["trace_prefix_hash"]
+        self.line_count = checkpoint["line_count"]
+        self.current_cycle = checkpoint["current_cycle"]
+        self.stock.inventory = checkpoint["inventory"]
+        self.running_processes = [(end_cycle, self.processes[process_id]) for end_cycle, process_id in checkpoint["running_processes"]]
+
 
 def print_final_info(end_cycle: int, stock_inventory: dict[str, int]) -> None:
     """
@@ -160,20 +406,57 @@ def print_final_info(end_cycle: int, stock_inventory: dict[str, int]) -> None:
     for resource, quantity in stock_inventory.items():
         print(f"- {resource}: {quantity}")
 
+def follow_trace(verifier: KrpSimVerifier, trace_file: str, checkpoint_file: str | None, follow: bool, poll_interval: float) -> bool:
+    """
+    Verify the trace incrementally, from the verifier's current position. When following, keep polling the trace
+    for appended lines until interrupted. The checkpoint, if any, is saved after every verified batch of complete lines.
+    Once the trace is over, a last line without newline is verified too, but left out of the checkpoint since the
+    trace's writer may still complete it.
+    :return: True if every verified line was valid, False otherwise.
+    """
+    while True:
+        new_lines = verifier.verify_appended(trace_file)
+        if new_lines is None:
+            return False
+        if new_lines:
+            if checkpoint_file is not None:
+                verifier.save_checkpoint(checkpoint_file)
+            if follow:
+                print(f"Cycle {verifier.current_cycle}: {new_lines} new {pluralize(word='line', plural_end='s', amount=new_lines)} verified.", flush=True)
+        if not follow:
+            break
+        try:
+            time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            break
+    return verifier.verify_appended(trace_file, include_partial_line=True) is not None
+
 def main() -> int:
     parser = argparse_verif_init()
     args = parser.parse_args()
 
-    stock, processes = parse(args.input_file)
-    parsed_lines = parse_trace(args.trace_file, processes)
+    stock, processes = parse_cached(args.input_file, args.cache_dir) if args.cache_dir else parse(args.input_file)
+    verifier = KrpSimVerifier(stock, processes)
+
+    if args.follow or args.checkpoint:
+        if args.checkpoint and os.path.isfile(args.checkpoint):
+            verifier.load_checkpoint(args.checkpoint, args.trace_file)
+        if not follow_trace(verifier, args.trace_file, args.checkpoint, args.follow, args.poll_interval):
+            print_final_info(verifier.current_cycle, verifier.stock.inventory)
+            return 1
+        verifier.finish()
+        print("Simulation completed successfully.")
+        print_final_info(verifier.current_cycle, verifier.stock.inventory)
+        return 0
+
+    parsed_trace = parse_trace(args.trace_file, processes)
 
     exit_code = 0
-    if not parsed_lines:
+    if parsed_trace is None or not parsed_trace[0]:
         print_final_info(0, stock.inventory)
         return 0
 
-    verifier = KrpSimVerifier(stock, processes)
-    if not verifier.run(parsed_lines):
+    if not verifier.run(*parsed_trace):
         exit_code = 1
 
     if exit_code == 0:
@@ -0,0 +1,66 @@
+import random
+from collections import deque
+from uuid import uuid4
+
+from kr_config import DEMAND_DECAY, MIN_DEMAND
+from process import Process
+from stock import Stock
+
+
+MIN_WEIGHT = 0.001
+
+def get_process_contributions(stock: Stock, processes: list[Process]) -> dict[str, float]:
+    """
+    Estimates how much each process contributes to the resources to optimize with a backward demand propagation.
+    Resources to optimize have a demand of 1. A process producing a demanded resource contributes that demand,
+    and its inputs are in turn demanded, decayed by DEMAND_DECAY for every step away from the resources to optimize.
+    :return: dict[str, float] - The contribution of each process, 0 for processes that do not lead to any resource to optimize.
+    """
+    producers: dict[str, list[Process]] = {}
+    for process in processes:
+        for output, quantity in (process.outputs or {}).items():
+            # Only processes that end up with more of the resource than they needed actually produce it
+            if quantity > (process.inputs or {}).get(output, 0):
+                producers.setdefault(output, []).append(process)
+
+    demand = {resource: 1.0 for resource in stock.resources_to_optimize if resource != "time"}
+    contributions = {process.name: 0.0 for process in processes}
+    resources_to_visit = deque(demand)
+    while resources_to_visit:
+        resource = resources_to_visit.popleft()
+        resource_demand = demand[resource]
+        for process in producers.get(resource, []):
+            if resource_demand <= contributions[process.name]:
+                continue
+            contributions[process.name] = resource_demand
+            input_demand = resource_demand * DEMAND_DECAY
+            if input_demand < MIN_DEMAND:
+                continue
+            for required_input in process.inputs or {}:
+                if input_demand > demand.get(required_input, 0.0):
+                    demand[required_input] = input_demand
+                    resources_to_visit.append(required_input)
+    return contributions
+
+
+def generate_seeded_weights(stock: Stock, processes: list[Process], amount: int) -> list[tuple[dict[str, float], str]]:
+    """
+    Generates weight vectors biased towards the processes that contribute to the resources to optimize.
+    Each vector gets its own noise so that seeded individuals do not all behave the same, and a low waiting weight.
+    :return: list[tuple[dict[str, float], str]] - The weights and the uuid of their waiting weight. Empty if nothing can be inferred.
+    """
+    contributions = get_process_contributions(stock, processes)
+    max_contribution = max(contributions.values(), default=0.0)
+    if max_contribution == 0:
+        return []
+
+    seeded_weights = []
+    for _ in range(amount):
+        weights: dict[str, float] = {}
+        for process in processes:
+            weight = MIN_WEIGHT + (1 - MIN_WEIGHT) * contributions[process.name] / max_contribution
+            weights[process.name] = max(min(1.0, weight + random.gauss(0, 0.1)), MIN_WEIGHT)
+        random_wait_uuid = str(uuid4())
+        weights[random_wait_uuid] = max(random.random() * 0.1, MIN_WEIGHT)
+        seeded_weights.append((weights, random_wait_uuid))
+    return seeded_weights
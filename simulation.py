@@ -1,13 +1,21 @@
+import json
 import logging
 import random
-from multiprocessing import Pool
+import time
+from collections.abc import Callable
+from multiprocessing.pool import Pool
 from os import cpu_count
+from threading import Event
 
 import kr_config
-from kr_config import POPULATION_SIZE
+from kr_config import (HEURISTIC_SEED_RATIO, LOCAL_SEARCH_ELITES, LOCAL_SEARCH_NEIGHBOURS, LOCAL_SEARCH_STEP,
+                       LOCAL_SEARCH_TIME_RATIO, POPULATION_SIZE)
 from process import Process
 from stock import Stock
 from Manager import Manager
+from seeding import generate_seeded_weights
+from upper_bound import compute_upper_bound, get_optimized_quantity
+from utils.atomic_write import atomic_write
 from utils.is_time_up import is_time_up
 
 
@@ -52,7 +60,7 @@ def next_generation(gen_id: int, sorted_population: list[Manager], stock: Stock,
         else:
             random_wait_uuid = parent_two.random_wait_uuid
             weights[random_wait_uuid] = parent_two.weights[random_wait_uuid]
-        new_population.append(generate_individual(manager_id=i + 1, gen_id=gen_id, stock=stock, processes=processes, end_timestamp=end_timestamp, weights=weights))
+        new_population.append(generate_individual(manager_id=i + 1, gen_id=gen_id, stock=stock, processes=processes, end_timestamp=end_timestamp, weights=weights, random_wait_uuid=random_wait_uuid))
 
     return new_population
 
@@ -65,56 +73,178 @@ def generate_individual(gen_id: int, stock: Stock, processes: list[Process], man
 
 def generate_population(size: int, gen_id: int, stock: Stock, processes: list[Process], end_timestamp: float) -> list[Manager]:
     """
-    Generates the population.
+    Generates the population. Part of it is seeded with weights biased towards the processes leading to the resources
+    to optimize, the rest with random weights.
     :return: list[Manager]
     """
-    return [generate_individual(gen_id, stock, processes, index + 1, end_timestamp) for index in range(size)]
+    seeded_weights = generate_seeded_weights(stock, processes, int(size * HEURISTIC_SEED_RATIO))
+    population = [
+        generate_individual(gen_id, stock, processes, index + 1, end_timestamp, weights=weights, random_wait_uuid=random_wait_uuid)
+        for index, (weights, random_wait_uuid) in enumerate(seeded_weights)
+    ]
+    population += [generate_individual(gen_id, stock, processes, index + 1, end_timestamp) for index in range(len(population), size)]
+    return population
 
 
+def generate_neighbour(manager: Manager, stock: Stock, processes: list[Process], end_timestamp: float, keep_seed: bool) -> Manager:
+    """
+    Generates a neighbour of the manager by perturbing one of its genes, picked at random, and nothing else.
+    :param keep_seed: Whether the neighbour keeps the manager's random seed or draws a new one.
+    :return: Manager
+    """
+    weights = dict(manager.weights)
+    gene = random.choice([process.name for process in processes] + [manager.random_wait_uuid])
+    weights[gene] = max(min(1.0, weights[gene] + random.gauss(0, LOCAL_SEARCH_STEP)), 0.001)
+    return Manager(manager_id=manager.id, gen_id=manager.gen_id, stock=stock, processes=processes,
+                   end_timestamp=end_timestamp, weights=weights, random_wait_uuid=manager.random_wait_uuid,
+                   random_seed=manager.random_seed if keep_seed else None, mutate=False)
+
+def refine_elites(sorted_population: list[Manager], stock: Stock, processes: list[Process], end_timestamp: float, pool: Pool) -> list[Manager]:
+    """
+    Hill-climbs the best individuals: runs a few neighbours of each of them on the pool and replaces an individual
+    with its best neighbour when the latter scores higher.
+    :return: list[Manager] - The population sorted again.
+    """
+    elites = sorted_population[:LOCAL_SEARCH_ELITES]
+    neighbours = [
+        generate_neighbour(elite, stock, processes, end_timestamp, keep_seed=index % 2 == 0)
+        for elite in elites
+        for index in range(LOCAL_SEARCH_NEIGHBOURS)
+    ]
+    ran_neighbours = pool.map(run_manager_simulation, neighbours)
+
+    refined_population = list(sorted_population)
+    for elite_index, elite in enumerate(elites):
+        elite_neighbours = ran_neighbours[elite_index * LOCAL_SEARCH_NEIGHBOURS:(elite_index + 1) * LOCAL_SEARCH_NEIGHBOURS]
+        best_neighbour = max(elite_neighbours, key=lambda m: m.score)
+        if best_neighbour.score > elite.score:
+            refined_population[elite_index] = best_neighbour
+    return sorted(refined_population, key=lambda m: m.score, reverse=True)
+
 def run_manager_simulation(manager: Manager) -> Manager:
     if is_time_up(manager.end_timestamp):
         return manager
     manager.run()
     return manager
 
-def start(stock: Stock, processes: list[Process], end_timestamp: float) -> None:
+def write_best_manager(path: str, manager: Manager, generation_index: int) -> None:
     """
-    Starts the program's main loop.
+    Writes the manager's genome, score and trace to path, replacing the previous content atomically.
+    The file is only a copy of the run's progress: failing to write it is logged and does not stop the run.
     :return: None
     """
+    best = {
+        "generation": generation_index,
+        "score": manager.score,
+        "genome": {
+            "random_seed": manager.random_seed,
+            "random_wait_uuid": manager.random_wait_uuid,
+            "weights": manager.weights,
+        },
+        "trace": [f"{cycle}:{process_name}" for cycle, process_name in manager.trace],
+    }
+    try:
+        atomic_write(path, json.dumps(best).encode())
+    except OSError as e:
+        logger.warning(f"Could not write the best manager to {path}: {e}")
 
+def evolve(stock: Stock,
+           processes: list[Process],
+           end_timestamp: float,
+           pool: Pool,
+           on_generation: Callable[[int, Manager], None] | None = None,
+           on_improvement: Callable[[int, Manager], None] | None = None,
+           upper_bound: int | None = None,
+           cancelled: Event | None = None
+           ) -> tuple[Manager, int]:
+    """
+    Runs generations on the given pool until time is up, or until the best manager reaches the upper bound
+    on the quantity of resources to optimize, if one is given and time is not optimized too. Setting the cancelled event stops it before the next generation.
+    When local search is enabled, the best individuals are refined between generations, within LOCAL_SEARCH_TIME_RATIO of the time left.
+    on_generation is called with each generation's best manager, on_improvement only when it beats the all-time best score.
+    :return: tuple[Manager, int] - The Manager Of All Time and the amount of generations that were run.
+    """
     population = generate_population(size=POPULATION_SIZE, gen_id=1, stock=stock, processes=processes, end_timestamp=end_timestamp)
     top_five_percent = get_top_five_percent()
+    local_search_budget = (end_timestamp - time.monotonic()) * LOCAL_SEARCH_TIME_RATIO
+    local_search_time = 0.0
 
     generation_index = 0
-    with Pool(processes=cpu_count()) as pool:
-        while True:
-            if is_time_up(end_timestamp):
-                logger.debug("Time is up (Start of loop)")
-                break
-
-            if generation_index == 0:
-                managers_to_run = population
-                managers_skipped = []
-            else:
-                managers_skipped = population[:top_five_percent]
-                managers_to_run = population[top_five_percent:]
+    best_score = None
+    while True:
+        if is_time_up(end_timestamp):
+            logger.debug("Time is up (Start of loop)")
+            break
+        if cancelled is not None and cancelled.is_set():
+            logger.debug("Evolution cancelled")
+            break
+
+        if generation_index == 0:
+            managers_to_run = population
+            managers_skipped = []
+        else:
+            managers_skipped = population[:top_five_percent]
+            managers_to_run = population[top_five_percent:]
+
+        ran_managers = pool.map(run_manager_simulation, managers_to_run)
+        population = managers_skipped + ran_managers
 
-            ran_managers = pool.map(run_manager_simulation, managers_to_run)
-            population = managers_skipped + ran_managers
+        sorted_population = sorted(population, key=lambda m: m.score, reverse=True)
+        if kr_config.LOCAL_SEARCH and local_search_time < local_search_budget and not is_time_up(end_timestamp):
+            local_search_start = time.monotonic()
+            sorted_population = refine_elites(sorted_population, stock, processes, end_timestamp, pool)
+            local_search_time += time.monotonic() - local_search_start
 
-            sorted_population = sorted(population, key=lambda m: m.score, reverse=True)
-            best_manager = sorted_population[0]
-            if not kr_config.PRINT_ONLY_TRACE:
-                print("Generation {} - Best score : {} | Resources to optimize : {}\033[K".format(generation_index, best_manager.score, {k: best_manager.stock.inventory[k] for k in best_manager.stock.resources_to_optimize if k in best_manager.stock.inventory}), end="\r", flush=True)
+        best_manager = sorted_population[0]
+        if on_generation is not None:
+            on_generation(generation_index, best_manager)
 
-            population = next_generation(generation_index + 1, sorted_population, stock, processes,
-                                         end_timestamp)
+        if best_score is None or best_manager.score > best_score:
+            best_score = best_manager.score
+            if on_improvement is not None:
+                on_improvement(generation_index, best_manager)
 
+        # When time is optimized too, a manager reaching the bound could still do it in fewer cycles
+        if (upper_bound is not None and "time" not in stock.resources_to_optimize
+                and get_optimized_quantity(best_manager.stock) >= upper_bound):
+            logger.debug("Upper bound reached")
+            population = sorted_population
             generation_index += 1
+            break
+
+        population = next_generation(generation_index + 1, sorted_population, stock, processes,
+                                     end_timestamp)
+
+        generation_index += 1
     sorted_population = sorted(population, key=lambda m: m.score, reverse=True)
     # The Manager Of All Time
-    the_moat = sorted_population[0]
+    return sorted_population[0], generation_index
+
+def print_generation(generation_index: int, best_manager: Manager) -> None:
+    """
+    Prints the generation's best score on the current line.
+    :return: None
+    """
+    print("Generation {} - Best score : {} | Resources to optimize : {}\033[K".format(generation_index, best_manager.score, {k: best_manager.stock.inventory[k] for k in best_manager.stock.resources_to_optimize if k in best_manager.stock.inventory}), end="\r", flush=True)
+
+def start(stock: Stock, processes: list[Process], end_timestamp: float) -> None:
+    """
+    Starts the program's main loop.
+    :return: None
+    """
+    on_generation = None if kr_config.PRINT_ONLY_TRACE else print_generation
+    on_improvement = (
+        None
+        if kr_config.BEST_OUT_PATH is None
+        else lambda generation_index, manager: write_best_manager(kr_config.BEST_OUT_PATH, manager, generation_index)
+    )
+
+    upper_bound = compute_upper_bound(stock, processes, end_timestamp)
+    if not kr_config.PRINT_ONLY_TRACE and upper_bound is not None:
+        logger.info("Upper bound on the resources to optimize : {}".format(upper_bound))
+
+    with Pool(processes=cpu_count()) as pool:
+        the_moat, generation_index = evolve(stock, processes, end_timestamp, pool, on_generation, on_improvement, upper_bound)
     # Return to line before printing the trace
     if not kr_config.PRINT_ONLY_TRACE:
         print()
@@ -123,3 +253,12 @@ def start(stock: Stock, processes: list[Process], end_timestamp: float) -> None:
     if not kr_config.PRINT_ONLY_TRACE:
         logger.info("Manager Of All Time - Generation {} - Best score : {} | Final stock : {} | Cycles : {}"
                 .format(generation_index, the_moat.score, the_moat.stock.inventory, the_moat.cycle))
+        if upper_bound is not None:
+            optimality_gap = upper_bound - get_optimized_quantity(the_moat.stock)
+            if "time" in the_moat.stock.resources_to_optimize:
+                # The bound says nothing about the amount of cycles, so a zero gap does not prove the trace optimal
+                logger.info("Gap to the upper bound on the resources to optimize other than time : {} ({:.2%} of the upper bound {})"
+                        .format(optimality_gap, optimality_gap / upper_bound if upper_bound else 0, upper_bound))
+            else:
+                logger.info("Optimality gap : {} ({:.2%} of the upper bound {})"
+                        .format(optimality_gap, optimality_gap / upper_bound if upper_bound else 0, upper_bound))
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_verif(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "krpsim_verif.py", *args], cwd=REPO_ROOT, capture_output=True, text=True)
+
+
+def test_checkpoint_verifies_last_line_without_newline(tmp_path):
+    # The fixture's last line, 40:livraison, has no trailing newline
+    plain = run_verif("resources/simple", "test_traces/simple_valid_trace")
+    checkpointed = run_verif("resources/simple", "test_traces/simple_valid_trace", "--checkpoint", str(tmp_path / "checkpoint"))
+
+    assert checkpointed.returncode == plain.returncode == 0
+    assert checkpointed.stdout == plain.stdout
+    assert "- client_content: 1" in checkpointed.stdout
+
+
+def test_checkpoint_resume_verifies_last_line_again(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint")
+    run_verif("resources/simple", "test_traces/simple_valid_trace", "--checkpoint", checkpoint)
+    resumed = run_verif("resources/simple", "test_traces/simple_valid_trace", "--checkpoint", checkpoint)
+
+    assert resumed.returncode == 0
+    assert "Simulation ended at cycle 60." in resumed.stdout
+    assert "- client_content: 1" in resumed.stdout
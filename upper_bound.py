@@ -0,0 +1,129 @@
+import logging
+import math
+import time
+
+from kr_config import MAX_CYCLE_PER_MANAGER, UPPER_BOUND_MAX_PIVOTS, UPPER_BOUND_TIME_RATIO
+from process import Process
+from stock import Stock
+from utils.is_time_up import is_time_up
+
+
+EPSILON = 1e-9
+
+logger = logging.getLogger()
+
+def get_optimized_quantity(stock: Stock) -> int:
+    """
+    Sums the quantities of the resources to optimize held in the stock.
+    :return: int
+    """
+    return sum(stock.get_quantity(resource) for resource in stock.resources_to_optimize if resource != "time")
+
+
+def compute_upper_bound(stock: Stock, processes: list[Process], end_timestamp: float, horizon: int = MAX_CYCLE_PER_MANAGER) -> int | None:
+    """
+    Computes an upper bound on the total quantity of resources to optimize reachable within horizon cycles,
+    from a linear relaxation of the process network. Each process gets a fractional amount of completed executions, subject to:
+    - for every resource, the executions cannot consume more than the initial stock plus what they produce;
+    - for every resource no process produces more of than it needs, the units held by running executions over the
+      horizon cannot exceed the initial stock times the horizon.
+    Processes lasting longer than the horizon cannot complete and are left out.
+    Solving is given up once UPPER_BOUND_TIME_RATIO of the time left before end_timestamp is spent.
+    :return: int | None - The bound, None if the relaxation is unbounded, cannot be solved in time or if only time is optimized.
+    """
+    targets = [resource for resource in stock.resources_to_optimize if resource != "time"]
+    if not targets:
+        return None
+
+    candidates = [process for process in processes if process.delay < horizon]
+    resources = sorted({resource for process in candidates for resource in (process.inputs or {}) | (process.outputs or {})})
+    net_produced = {
+        resource
+        for process in candidates
+        for resource, quantity in (process.outputs or {}).items()
+        if quantity > (process.inputs or {}).get(resource, 0)
+    }
+
+    constraints: list[list[float]] = []
+    limits: list[float] = []
+    for resource in resources:
+        # Consumed minus produced cannot exceed the initial stock
+        constraints.append([
+            (process.inputs or {}).get(resource, 0) - (process.outputs or {}).get(resource, 0)
+            for process in candidates
+        ])
+        limits.append(stock.get_quantity(resource))
+        if resource not in net_produced:
+            # Units of the resource held by running executions, summed over the horizon
+            constraints.append([(process.inputs or {}).get(resource, 0) * process.delay for process in candidates])
+            limits.append(stock.get_quantity(resource) * horizon)
+
+    objective = [
+        sum((process.outputs or {}).get(target, 0) - (process.inputs or {}).get(target, 0) for target in targets)
+        for process in candidates
+    ]
+    deadline = time.monotonic() + max(0.0, end_timestamp - time.monotonic()) * UPPER_BOUND_TIME_RATIO
+    optimum = maximize(objective, constraints, limits, deadline)
+    if optimum is None:
+        return None
+    return sum(stock.get_quantity(target) for target in targets) + math.floor(optimum + 1e-6)
+
+
+def maximize(objective: list[float], constraints: list[list[float]], limits: list[float], deadline: float) -> float | None:
+    """
+    Solves max(objective . x) subject to constraints . x <= limits and x >= 0 with the simplex method.
+    The limits must be non-negative so that x = 0 is a feasible starting point. Bland's rule prevents cycling.
+    Gives up when the deadline passes, when the pivots done so far project past it, or after UPPER_BOUND_MAX_PIVOTS pivots.
+    :return: float | None - The optimum, None if it is unbounded or was given up.
+    """
+    start = time.monotonic()
+    nb_variables = len(objective)
+    nb_constraints = len(constraints)
+    # One row per constraint with its slack variable, the last column holds the limit
+    tableau = [
+        row + [1.0 if slack == index else 0.0 for slack in range(nb_constraints)] + [limit]
+        for index, (row, limit) in enumerate(zip(constraints, limits))
+    ]
+    # Reduced costs, the last column holds minus the objective's value
+    costs = list(objective) + [0.0] * nb_constraints + [0.0]
+    basis = [nb_variables + index for index in range(nb_constraints)]
+
+    nb_pivots = 0
+    while True:
+        if nb_pivots >= UPPER_BOUND_MAX_PIVOTS:
+            logger.debug("Upper bound given up: too many pivots")
+            return None
+        # The simplex usually needs a few times as many pivots as constraints: give up early if they cannot fit
+        if nb_pivots and start + (time.monotonic() - start) / nb_pivots * 2 * nb_constraints > deadline:
+            logger.debug("Upper bound given up: not enough time to solve the relaxation")
+            return None
+
+        entering = next((column for column, cost in enumerate(costs[:-1]) if cost > EPSILON), None)
+        if entering is None:
+            return -costs[-1]
+
+        leaving = None
+        best_ratio = math.inf
+        for index, row in enumerate(tableau):
+            if row[entering] > EPSILON:
+                ratio = row[-1] / row[entering]
+                if ratio < best_ratio - EPSILON or (abs(ratio - best_ratio) <= EPSILON and basis[index] < basis[leaving]):
+                    best_ratio = ratio
+                    leaving = index
+        if leaving is None:
+            return None
+
+        pivot_row = tableau[leaving]
+        pivot = pivot_row[entering]
+        tableau[leaving] = pivot_row = [value / pivot for value in pivot_row]
+        for index, row in enumerate(tableau):
+            if is_time_up(deadline):
+                logger.debug("Upper bound given up: time is up")
+                return None
+            if index != leaving and row[entering] != 0:
+                factor = row[entering]
+                tableau[index] = [value - factor * pivot_value for value, pivot_value in zip(row, pivot_row)]
+        factor = costs[entering]
+        costs = [value - factor * pivot_value for value, pivot_value in zip(costs, pivot_row)]
+        basis[leaving] = entering
+        nb_pivots += 1
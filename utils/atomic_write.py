@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+
+# Read once at import: os.umask can only be read by setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Writes data to path through a temporary file in the same directory, then renames it over path.
+    Readers either see the previous content or the new one, never a partially written file.
+    The file gets the same permissions as one created with open(), instead of the private ones of temporary files.
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise